@@ -3,156 +3,169 @@ import argparse
 import os
 import math
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
-from PIL import Image
+import cv2  # 使用OpenCV加速图像读写
+from functools import lru_cache
 
-def hilbert_curve_generator(n):
+# 希尔伯特曲线状态表：下标 (state << 2) | q，值 (next_state << 2) | (dx << 1) | dy
+HILBERT_LUT = np.array([4, 1, 3, 10, 0, 6, 7, 13, 15, 9, 8, 2, 11, 14, 12, 5], dtype=np.uint8)
+
+def hilbert_curve_generator(n, width, height):
     '''
-    生成希尔伯特曲线
+    使用 NumPy 逐层展开四叉树生成 n 阶希尔伯特曲线 (查表法)，只保留 width x height 范围内的点
+    整块落在图像外的子方块直接剪枝，工作量为 O(width*height) 而非 O(4^n)
+    返回 shape=(width*height, 2) 的坐标数组 (n <= 16 时为 uint16，否则为 uint32)，每行代表一个 (x, y) 坐标，按曲线顺序排列
     '''
-    size = 2 ** n
-    curve = []
-    for d in range(size * size):
-        x, y = 0, 0
-        t = d
-        s = 1
-        while s < size:
-            rx = (t // 2) & 1
-            ry = (t ^ rx) & 1
-            if ry == 0:
-                if rx == 1:
-                    x = s - 1 - x
-                    y = s - 1 - y
-                x, y = y, x
-            x += s * rx
-            y += s * ry
-            t //= 4
-            s *= 2
-        curve.append((x, y))
-    return curve
-
+    # 存活子方块的坐标高位及朝向 (state << 2)；坐标 < 2^n，n <= 16 时 uint16 足够，超出则用 uint32
+    coord_dtype = np.uint16 if n <= 16 else np.uint32
+    X = np.zeros(1, dtype=coord_dtype)
+    Y = np.zeros(1, dtype=coord_dtype)
+    state = np.zeros(1, dtype=np.uint8)
+    q = np.arange(4, dtype=np.uint8)
+
+    # 自高位向低位，每层把每个子方块按曲线顺序拆成 4 份，共 n 层，每层只查一次表
+    for layer in range(n - 1, -1, -1):
+        v = HILBERT_LUT[(state[:, None] | q).ravel()]
+        X = (np.repeat(X, 4) << 1) | ((v >> 1) & 1)
+        Y = (np.repeat(Y, 4) << 1) | (v & 1)
+        state = v & 12  # 下一状态，已左移 2 位
+
+        # 边长 2^layer 的子方块，左上角超出图像即整块丢弃
+        limit_x = (width + (1 << layer) - 1) >> layer
+        limit_y = (height + (1 << layer) - 1) >> layer
+        if limit_x < (1 << (n - layer)) or limit_y < (1 << (n - layer)):
+            keep = (X < limit_x) & (Y < limit_y)
+            X, Y, state = X[keep], Y[keep], state[keep]
+
+    return np.column_stack((X, Y))
+
+@lru_cache(maxsize=32)
 def generate_mapping(width, height):
     '''
     生成映射表
+    同尺寸图像共用一份缓存，返回的数组为只读
     '''
     max_dim = max(width, height)
-    n = math.ceil(math.log2(max_dim)) if max_dim > 0 else 1
+    n = (max_dim - 1).bit_length()  # 即 ceil(log2(max_dim))，纯整数运算无浮点误差
     
     start_time = time.time()
-    curve = hilbert_curve_generator(n)
+    # 生成时已剪掉图像外的部分，无需再用掩码筛选
+    valid_curve = hilbert_curve_generator(n, width, height)
+    valid_curve.setflags(write=False)
     end_time = time.time()
     print(f"生成希尔伯特曲线耗时: {end_time - start_time:.2f}秒")
     
-    start_time = time.time()
-    valid_curve = []
-    for x, y in curve:
-        if x < width and y < height:
-            valid_curve.append((x, y))
-            if len(valid_curve) == width * height:
-                break
-    end_time = time.time()
-    print(f"生成映射表耗时: {end_time - start_time:.2f}秒")
-    
     return valid_curve
 
+def load_image_rgba(input_path):
+    """
+    使用 OpenCV 读取图像并统一转换为 RGBA，读取失败时返回 None
+    """
+    # cv2.imread 在 Windows 上无法打开中文等非 ASCII 路径，先按字节读入再解码
+    try:
+        data = np.fromfile(input_path, dtype=np.uint8)
+    except OSError:
+        return None
+    img = cv2.imdecode(data, cv2.IMREAD_UNCHANGED) if data.size else None
+    if img is None:
+        return None
+    if img.dtype == np.uint16:  # 16 位 PNG 降为 8 位
+        img = (img >> 8).astype(np.uint8)
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2RGBA)
+    if img.shape[2] == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGBA)
+    return cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
+
 def save_image_auto_mode(pixels, output_path):
     """
     根据文件后缀判断是否需要将RGBA转换成RGB,
-    然后保存图像
+    然后使用 OpenCV 保存图像，返回是否保存成功
     """
-    img = Image.fromarray(pixels)
     ext = os.path.splitext(output_path)[1].lower()
     if ext in [".jpg", ".jpeg"]:
-        if img.mode == "RGBA":
-            img = img.convert("RGB")
-    img.save(output_path)
+        ok, buf = cv2.imencode(ext, cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGR),
+                               [cv2.IMWRITE_JPEG_QUALITY, 95])
+    else:
+        ok, buf = cv2.imencode(ext, cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGRA))
+    # 先编码再按字节写出，cv2.imwrite 在 Windows 上无法写入非 ASCII 路径，且失败时不抛异常
+    if ok:
+        try:
+            buf.tofile(output_path)
+        except OSError:
+            ok = False
+    if not ok:
+        print(f"图像保存失败: {output_path}")
+        return False
     print(f"图像已保存至: {output_path}")
+    return True
 
-def encrypt_image(input_path, output_path):
+def _permute(pixels, shift):
     """
-    对图像执行希尔伯特混淆加密 - 使用 NumPy 高级索引
+    沿希尔伯特曲线将像素循环平移 shift 位 - 使用 NumPy 高级索引
+    加密传入 +offset，解密传入 -offset (解密即加密的逆置换)
     """
-    try:
-        img = Image.open(input_path).convert("RGBA")
-    except FileNotFoundError:
-        print("输入文件不存在:", input_path)
-        return
-
-    width, height = img.size
-    pixels = np.array(img)  # [height, width, 4]
+    height, width = pixels.shape[:2]
     
     # 生成映射表
     curve = generate_mapping(width, height)
-    # 将曲线坐标转换为 NumPy 数组，形状为 (total, 2)
-    curve_array = np.array(curve, dtype=int)  # 每个坐标 (x, y)
-    
-    golden_ratio = (math.sqrt(5) - 1) / 2
-    total = width * height
-    offset = round(golden_ratio * total)
+    # 曲线坐标为 uint16/uint32 数组，形状为 (total, 2)
+    curve_array = np.asarray(curve)  # 每个坐标 (x, y)
     
-    # old_inds: 加密前 (遍历 0 ~ total-1)，长度为 total
-    # new_inds: 加密后位置 = (old_inds + offset) % total
-    old_inds = np.arange(total)
-    new_inds = (old_inds + offset) % total
+    # 即在希尔伯特顺序上循环平移 shift：
+    #   new_pixels[curve[(i + shift) % total]] = pixels[curve[i]]
+    # 注意: 数组像素访问顺序为 [row, col] = [y, x]
+    # 坐标 (x, y) 转为一维下标 y*width + x，像素按 (H*W, 4) 视图索引
+    flat = curve_array[:, 1].astype(np.int64) * width + curve_array[:, 0]
     
-    # old_coords[i] = (old_x, old_y)
-    # new_coords[i] = (new_x, new_y)
-    old_coords = curve_array[old_inds]
-    new_coords = curve_array[new_inds]
+    # 每个 RGBA 像素视为一个 uint32，先按曲线顺序取出所有像素 (一次 gather)
+    pix32 = pixels.view(np.uint32).reshape(-1)
+    hilbert_pixels = pix32[flat]
     
-    # 创建空白像素数组
-    new_pixels = np.zeros_like(pixels)
+    # 映射覆盖全部 width*height 个像素，每个位置都会被写入，无需清零
+    new32 = np.empty_like(pix32)
     
-    # 利用高级索引，一次性完成映射
-    # 注意: 数组像素访问顺序为 [row, col] = [y, x]，因此：
-    # new_pixels[new_y, new_x] = pixels[old_y, old_x]
-    new_pixels[new_coords[:, 1], new_coords[:, 0]] = pixels[old_coords[:, 1], old_coords[:, 0]]
+    # 循环平移后按曲线顺序写回 (一次 scatter)
+    new32[flat] = np.roll(hilbert_pixels, shift)
+    return new32.view(np.uint8).reshape(height, width, 4)
+
+def encrypt_image(input_path, output_path):
+    """
+    对图像执行希尔伯特混淆加密 - 使用 NumPy 高级索引
+    """
+    pixels = load_image_rgba(input_path)  # [height, width, 4]
+    if pixels is None:
+        print("输入文件不存在或无法读取:", input_path)
+        return
+
+    height, width = pixels.shape[:2]
+    golden_ratio = (math.sqrt(5) - 1) / 2
+    offset = round(golden_ratio * width * height)
+    new_pixels = _permute(pixels, offset)
 
     # 保存加密后图像
-    save_image_auto_mode(new_pixels, output_path)
-    print(f"加密完成: {output_path}")
+    if save_image_auto_mode(new_pixels, output_path):
+        print(f"加密完成: {output_path}")
 
 def decrypt_image(input_path, output_path):
     """
     对图像执行希尔伯特混淆解密 - 使用 NumPy 高级索引
     """
-    try:
-        img = Image.open(input_path).convert("RGBA")
-    except FileNotFoundError:
-        print("输入文件不存在:", input_path)
+    pixels = load_image_rgba(input_path)  # [height, width, 4]
+    if pixels is None:
+        print("输入文件不存在或无法读取:", input_path)
         return
 
-    width, height = img.size
-    pixels = np.array(img)  # [height, width, 4]
-    
-    # 生成映射表
-    curve = generate_mapping(width, height)
-    curve_array = np.array(curve, dtype=int)  # (total, 2)
-    
+    height, width = pixels.shape[:2]
     golden_ratio = (math.sqrt(5) - 1) / 2
-    total = width * height
-    offset = round(golden_ratio * total)
-    
-    # 解密逻辑与加密相反：
-    # 原循环形式： 
-    #   encrypted_idx = (i + offset) % total
-    #   ex, ey = curve[encrypted_idx]
-    #   dx, dy = curve[i]
-    #   decrypted_pixels[dy, dx] = pixels[ey, ex]
-    # => 可转换为批量操作：
-    old_inds = np.arange(total)
-    encrypted_inds = (old_inds + offset) % total
+    offset = round(golden_ratio * width * height)
+    # 解密逻辑与加密相反，即在希尔伯特顺序上反向平移 offset
+    new_pixels = _permute(pixels, -offset)
     
-    # 加密后像素对应的坐标
-    encrypted_coords = curve_array[encrypted_inds]  # (ex, ey)
-    # 解密后目标坐标
-    decrypted_coords = curve_array[old_inds]        # (dx, dy)
-    
-    new_pixels = np.zeros_like(pixels)
-    new_pixels[decrypted_coords[:, 1], decrypted_coords[:, 0]] = pixels[encrypted_coords[:, 1], encrypted_coords[:, 0]]
-    
-    save_image_auto_mode(new_pixels, output_path)
-    print(f"解密完成: {output_path}")
+    if save_image_auto_mode(new_pixels, output_path):
+        print(f"解密完成: {output_path}")
 
 def main():
     '''
@@ -181,23 +194,31 @@ def main():
 
     print(f"即将处理 {len(files)} 个文件...")  # 告知用户当前待处理的图像文件数量
 
-    if args.encrypt:
-        # 用户选择加密操作
-        for i, f in enumerate(files, start=1):
-            print(f"[{i}/{len(files)}] 正在加密 -> {f}")
-            path = os.path.join(target_folder, f)
-            encrypt_image(path, path)  # 加密图像后直接覆盖原文件
-            print(f"[{i}/{len(files)}] 已完成加密: {f}")
-    elif args.decrypt:
-        # 用户选择解密操作
-        for i, f in enumerate(files, start=1):
-            print(f"[{i}/{len(files)}] 正在解密 -> {f}")
+    # 根据用户选择确定加密或解密操作，处理后直接覆盖原文件
+    task, action = (encrypt_image, "加密") if args.encrypt else (decrypt_image, "解密")
+
+    # 各文件相互独立，使用进程池并行处理 (默认进程数已按 CPU 数封顶，Windows 上不超过 61)
+    failed = []  # 处理失败的文件，原文件未被覆盖
+    with ProcessPoolExecutor() as executor:
+        futures = {}
+        for f in files:
             path = os.path.join(target_folder, f)
-            decrypt_image(path, path)  # 解密图像后直接覆盖原文件
-            print(f"[{i}/{len(files)}] 已完成解密: {f}")
+            futures[executor.submit(task, path, path)] = f
+        for i, future in enumerate(as_completed(futures), start=1):
+            try:
+                future.result()  # 子进程中的异常在此抛出
+            except Exception as e:
+                # 单个文件出错不影响其余文件，逐个报告以便确认哪些文件已被处理
+                failed.append(futures[future])
+                print(f"[{i}/{len(files)}] {action}失败: {futures[future]} - {e}")
+                continue
+            print(f"[{i}/{len(files)}] 已完成{action}: {futures[future]}")
 
     end_time = time.time()
+    if failed:
+        print(f"以下 {len(failed)} 个文件{action}失败: {', '.join(failed)}")
     print(f"全部处理完成，耗时：{end_time - start_time:.2f}秒")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包为 exe 后进程池需要
     main()
\ No newline at end of file
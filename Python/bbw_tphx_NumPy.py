@@ -3,155 +3,173 @@ import argparse
 import os
 import math
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
-from PIL import Image
+import cv2  # 使用OpenCV加速图像读写
+from functools import lru_cache
 
-def hilbert_curve_generator(n):
+# 希尔伯特曲线状态表 (自高位向低位解码)
+# 下标 = (state << 2) | q，q 为 d 在当前层的两位，state ∈ {0..3} 为当前子方块的朝向
+# (0: 不变, 1: 沿主对角线交换 x/y, 2: 沿副对角线交换, 3: 旋转 180°)
+# 值 = (next_state << 2) | (dx << 1) | dy，dx/dy 为当前层输出的坐标位
+HILBERT_LUT = np.array([4, 1, 3, 10, 0, 6, 7, 13, 15, 9, 8, 2, 11, 14, 12, 5], dtype=np.uint8)
+
+def hilbert_curve_generator(n, width, height):
     """
-    使用 NumPy 向量化加速生成 n 阶希尔伯特曲线，每个 d ∈ [0, 2^(2n)-1] 转换到 (x, y)。
-    返回形如 (2^(2n), 2) 的数组，每行代表一个 (x, y) 坐标。
+    使用 NumPy 向量化生成 n 阶希尔伯特曲线上落在 width x height 范围内的坐标 (按曲线顺序)。
+    返回形如 (width*height, 2) 的坐标数组 (n <= 16 时为 uint16，否则为 uint32)，每行代表一个 (x, y) 坐标。
+    采用查表法：自高位向低位逐层展开四叉树，每层一次 16 项查表同时得到坐标位和下一状态；
+    曲线在每个子方块内连续，整块落在图像外的子方块连同其全部后代直接剪掉，
+    因此总工作量为 O(width*height)，不再生成 2^(2n) 个点再用掩码筛选。
     """
-    size = 1 << n            # 2^n
-    total = size * size      # 2^(2n)
-    D = np.arange(total, dtype=np.uint32)
-    X = np.zeros_like(D)
-    Y = np.zeros_like(D)
-
-    # 每次处理 2 个 bit，逐层生成
-    for sPow in range(n):
-        s = 1 << sPow
-        # 取出当前位平面的 rx, ry
-        rx = (D >> 1) & 1
-        ry = (D ^ rx) & 1
-
-        mask_ry_zero = (ry == 0)
-        mask_flip = (rx == 1) & mask_ry_zero
-
-        # 在需要翻转的像素上执行翻转 (x, y) = (s-1-x, s-1-y)
-        X[mask_flip] = s - 1 - X[mask_flip]
-        Y[mask_flip] = s - 1 - Y[mask_flip]
-
-        # 在 ry=0 的像素上执行 (x, y) 交换
-        idx_swap = np.where(mask_ry_zero)[0]
-        X[idx_swap], Y[idx_swap] = Y[idx_swap], X[idx_swap].copy()
-
-        # 最后按 (rx, ry) 进行坐标平移
-        X += s * rx
-        Y += s * ry
-
-        # 处理完这两位，右移 2，为下一层做准备
-        D >>= 2
-
-    # 返回 shape=(total,2) 的坐标数组
+    # 当前层存活的子方块：左上角坐标 (高位部分) 与朝向 (state << 2)
+    # 坐标不超过 2^n - 1，n <= 16 时用 uint16 减少内存带宽，否则用 uint32 防止溢出
+    coord_dtype = np.uint16 if n <= 16 else np.uint32
+    X = np.zeros(1, dtype=coord_dtype)
+    Y = np.zeros(1, dtype=coord_dtype)
+    state = np.zeros(1, dtype=np.uint8)
+    q = np.arange(4, dtype=np.uint8)
+
+    # 每次处理 2 个 bit，从最高层开始
+    for layer in range(n - 1, -1, -1):
+        # 每个子方块按曲线顺序 q = 0..3 拆成 4 个子方块
+        v = HILBERT_LUT[(state[:, None] | q).ravel()]
+
+        # 追加当前层的坐标位
+        X = (np.repeat(X, 4) << 1) | ((v >> 1) & 1)
+        Y = (np.repeat(Y, 4) << 1) | (v & 1)
+
+        # 下一状态 (已左移 2 位)，为下一层做准备
+        state = v & 12
+
+        # 子方块边长为 2^layer，左上角 (X << layer, Y << layer) 在图像内才保留
+        side = 1 << (n - layer)
+        limit_x = (width + (1 << layer) - 1) >> layer
+        limit_y = (height + (1 << layer) - 1) >> layer
+        if limit_x < side or limit_y < side:
+            keep = (X < limit_x) & (Y < limit_y)
+            X, Y, state = X[keep], Y[keep], state[keep]
+
+    # 返回 shape=(width*height,2) 的坐标数组
     return np.column_stack((X, Y))
 
+@lru_cache(maxsize=32)
 def generate_mapping(width, height):
     """
     生成与给定 (width, height) 相匹配的希尔伯特映射表。
-    返回长度为 width*height 的 (x, y) 列表或数组。
+    返回长度为 width*height 的 (x, y) 只读数组，同尺寸图像共用缓存结果。
     """
     max_dim = max(width, height)
-    n = math.ceil(math.log2(max_dim)) if max_dim > 0 else 1
+    n = (max_dim - 1).bit_length()  # 即 ceil(log2(max_dim))，纯整数运算无浮点误差
 
     print("开始生成希尔伯特曲线...")
     start_time = time.time()
-    curve = hilbert_curve_generator(n)  # shape=(2^(2n), 2)
+    # 生成时已剪掉图像外的子方块，结果即为映射表，无需再筛选
+    valid_curve = hilbert_curve_generator(n, width, height)  # shape=(width*height, 2)
+    valid_curve.setflags(write=False)
     end_time = time.time()
     print(f"生成希尔伯特曲线耗时: {end_time - start_time:.2f}秒")
 
-    print("开始筛选映射表...")
-    start_time = time.time()
-    # 用布尔掩码一键筛选 (x < width, y < height)
-    mask = (curve[:, 0] < width) & (curve[:, 1] < height)
-    filtered = curve[mask]
-    # 截取前 width*height 个坐标
-    valid_curve = filtered[: (width * height)]
-    end_time = time.time()
-    print(f"筛选映射表耗时: {end_time - start_time:.2f}秒")
-
-    # 若后面要用 NumPy 索引，可直接 return valid_curve
-    # 若喜欢 Python 列表，可用 valid_curve.tolist()
     return valid_curve
 
+def load_image_rgba(input_path):
+    """
+    使用 OpenCV 读取图像并统一转换为 RGBA，读取失败时返回 None
+    """
+    # cv2.imread 在 Windows 上无法打开中文等非 ASCII 路径，先按字节读入再解码
+    try:
+        data = np.fromfile(input_path, dtype=np.uint8)
+    except OSError:
+        return None
+    img = cv2.imdecode(data, cv2.IMREAD_UNCHANGED) if data.size else None
+    if img is None:
+        return None
+    if img.dtype == np.uint16:  # 16 位 PNG 降为 8 位
+        img = (img >> 8).astype(np.uint8)
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2RGBA)
+    if img.shape[2] == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGBA)
+    return cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
+
 def save_image_auto_mode(pixels, output_path):
     """
-    根据文件后缀判断是否需要将 RGBA 转换为 RGB，然后保存图像
+    根据文件后缀判断是否需要将 RGBA 转换为 RGB，然后使用 OpenCV 保存图像，返回是否保存成功
     """
-    img = Image.fromarray(pixels)
     ext = os.path.splitext(output_path)[1].lower()
     if ext in [".jpg", ".jpeg"]:
-        if img.mode == "RGBA":
-            img = img.convert("RGB")
-    img.save(output_path)
+        ok, buf = cv2.imencode(ext, cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGR),
+                               [cv2.IMWRITE_JPEG_QUALITY, 95])
+    else:
+        ok, buf = cv2.imencode(ext, cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGRA))
+    # 先编码再按字节写出，cv2.imwrite 在 Windows 上无法写入非 ASCII 路径，且失败时不抛异常
+    if ok:
+        try:
+            buf.tofile(output_path)
+        except OSError:
+            ok = False
+    if not ok:
+        print(f"图像保存失败: {output_path}")
+        return False
     print(f"图像已保存至: {output_path}")
+    return True
 
-def encrypt_image(input_path, output_path):
+def _permute(pixels, shift):
     """
-    使用 NumPy 高级索引，对图像执行希尔伯特混淆加密
+    沿希尔伯特曲线将像素循环平移 shift 位，加密传 +offset，解密传 -offset
     """
-    try:
-        img = Image.open(input_path).convert("RGBA")
-    except FileNotFoundError:
-        print("输入文件不存在:", input_path)
-        return
-
-    width, height = img.size
-    pixels = np.array(img)  # shape=[height, width, 4]
+    height, width = pixels.shape[:2]
 
     curve = generate_mapping(width, height)  # shape=(width*height, 2)
-    curve_array = np.array(curve, dtype=np.int32)
+    curve_array = np.asarray(curve)
 
-    total = width * height
-    golden_ratio = (math.sqrt(5) - 1) / 2
-    offset = round(golden_ratio * total)
+    # 按曲线顺序取出像素，循环平移 shift 后再按曲线顺序写回
+    # 等价于 new_pixels[curve[(i + shift) % total]] = pixels[curve[i]]
+    # 注意: 数组访问顺序 new_pixels[y, x]
+    # 坐标 (x, y) 转为一维下标 y*width + x，避免二维高级索引
+    flat = curve_array[:, 1].astype(np.int64) * width + curve_array[:, 0]
+    # 每个 RGBA 像素视为一个 uint32，整体搬运
+    pix32 = pixels.view(np.uint32).reshape(-1)
+    hilbert_pixels = pix32[flat]
 
-    old_inds = np.arange(total)
-    new_inds = (old_inds + offset) % total
+    # 映射是全部像素上的双射，每个位置都会被写入，省去清零
+    new32 = np.empty_like(pix32)
+    new32[flat] = np.roll(hilbert_pixels, shift)
+    return new32.view(np.uint8).reshape(height, width, 4)
 
-    # old_coords[i] = (old_x, old_y)
-    # new_coords[i] = (new_x, new_y)
-    old_coords = curve_array[old_inds]
-    new_coords = curve_array[new_inds]
+def encrypt_image(input_path, output_path):
+    """
+    使用 NumPy 高级索引，对图像执行希尔伯特混淆加密
+    """
+    pixels = load_image_rgba(input_path)  # shape=[height, width, 4]
+    if pixels is None:
+        print("输入文件不存在或无法读取:", input_path)
+        return
 
-    new_pixels = np.zeros_like(pixels)
-    # 注意: 数组访问顺序 new_pixels[y, x]
-    new_pixels[new_coords[:, 1], new_coords[:, 0]] = pixels[old_coords[:, 1], old_coords[:, 0]]
+    height, width = pixels.shape[:2]
+    golden_ratio = (math.sqrt(5) - 1) / 2
+    offset = round(golden_ratio * width * height)
 
-    save_image_auto_mode(new_pixels, output_path)
-    print(f"加密完成: {output_path}")
+    if save_image_auto_mode(_permute(pixels, offset), output_path):
+        print(f"加密完成: {output_path}")
 
 def decrypt_image(input_path, output_path):
     """
     使用 NumPy 高级索引，对图像执行希尔伯特混淆解密
     """
-    try:
-        img = Image.open(input_path).convert("RGBA")
-    except FileNotFoundError:
-        print("输入文件不存在:", input_path)
+    pixels = load_image_rgba(input_path)  # shape=[height, width, 4]
+    if pixels is None:
+        print("输入文件不存在或无法读取:", input_path)
         return
 
-    width, height = img.size
-    pixels = np.array(img)  # shape=[height, width, 4]
-
-    curve = generate_mapping(width, height)
-    curve_array = np.array(curve, dtype=np.int32)
-
-    total = width * height
+    height, width = pixels.shape[:2]
     golden_ratio = (math.sqrt(5) - 1) / 2
-    offset = round(golden_ratio * total)
-
-    old_inds = np.arange(total)
-    encrypted_inds = (old_inds + offset) % total
-
-    encrypted_coords = curve_array[encrypted_inds]
-    decrypted_coords = curve_array[old_inds]
+    offset = round(golden_ratio * width * height)
 
-    new_pixels = np.zeros_like(pixels)
-    new_pixels[decrypted_coords[:, 1], decrypted_coords[:, 0]] = \
-        pixels[encrypted_coords[:, 1], encrypted_coords[:, 0]]
-
-    save_image_auto_mode(new_pixels, output_path)
-    print(f"解密完成: {output_path}")
+    # 解密为加密的逆置换，即反向平移 offset
+    if save_image_auto_mode(_permute(pixels, -offset), output_path):
+        print(f"解密完成: {output_path}")
 
 def main():
     """
@@ -179,19 +197,30 @@ def main():
 
     print(f"开始处理 {len(files)} 个文件...")
 
-    if args.encrypt:
-        for i, f in enumerate(files, start=1):
-            path = os.path.join(target_folder, f)
-            print(f"[{i}/{len(files)}] 加密 -> {f}")
-            encrypt_image(path, path)
-    else:
-        for i, f in enumerate(files, start=1):
+    task, action = (encrypt_image, "加密") if args.encrypt else (decrypt_image, "解密")
+
+    # 文件之间互不依赖，交给进程池并行处理 (默认进程数已按 CPU 数封顶，Windows 上不超过 61)
+    failed = []
+    with ProcessPoolExecutor() as executor:
+        futures = {}
+        for f in files:
             path = os.path.join(target_folder, f)
-            print(f"[{i}/{len(files)}] 解密 -> {f}")
-            decrypt_image(path, path)
+            futures[executor.submit(task, path, path)] = f
+        for i, future in enumerate(as_completed(futures), start=1):
+            # 逐个报告失败的文件并继续，避免其余文件在无提示的情况下被覆盖
+            try:
+                future.result()
+            except Exception as e:
+                failed.append(futures[future])
+                print(f"[{i}/{len(files)}] {action}失败 -> {futures[future]}: {e}")
+                continue
+            print(f"[{i}/{len(files)}] {action}完成 -> {futures[future]}")
 
     end_time = time.time()
+    if failed:
+        print(f"{len(failed)} 个文件{action}失败，原文件未改动: {', '.join(failed)}")
     print(f"全部处理完成，耗时: {end_time - start_time:.2f}秒")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包为 exe 后进程池需要
     main()
\ No newline at end of file
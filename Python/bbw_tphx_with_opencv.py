@@ -2,184 +2,194 @@ import argparse
 import os
 import math
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import cv2  # 使用OpenCV加速图像处理
 from functools import lru_cache
+from numba import njit, prange, set_num_threads  # 使用Numba加速曲线生成与像素重排
 
 # ---------- 全局常量 ----------
 GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
 
+# 希尔伯特曲线状态表 (自高位向低位解码)
+# 下标 = (state << 2) | q，q 为 d 在当前层的两位，state ∈ {0..3} 为当前子方块的朝向
+# (0: 不变, 1: 沿主对角线交换 x/y, 2: 沿副对角线交换, 3: 旋转 180°)
+# 值 = (next_state << 2) | (dx << 1) | dy，dx/dy 为当前层输出的坐标位
+HILBERT_LUT = np.array([4, 1, 3, 10, 0, 6, 7, 13, 15, 9, 8, 2, 11, 14, 12, 5], dtype=np.uint8)
+
 # ---------- 优化后的曲线生成函数 ----------
-@lru_cache(maxsize=10)
-def hilbert_curve_generator(n):
+@njit(cache=True)
+def hilbert_fill(n, width, height, out):
     """
-    使用 NumPy 向量化加速生成 n 阶希尔伯特曲线，每个 d ∈ [0, 2^(2n)-1] 转换到 (x, y)。
-    返回 shape=(size*size,2) 的数组，其中 size=2^n。
+    Numba 内核：按曲线顺序把 n 阶希尔伯特曲线上 x < width 且 y < height 的点写入 out。
+    自高位向低位深度优先展开四叉树，每个子方块查一次 HILBERT_LUT 得到坐标位和下一朝向；
+    曲线在每个子方块内连续，左上角已超出图像的子方块连同其 4^layer 个点整段跳过，
+    因此工作量为 O(width*height) 而非 O(4^n)。返回写入的点数。
     """
-    size = 1 << n              # 2^n
-    total = size * size        # 2^(2n)
-    # 创建一系列从 0 到 total-1 的整数，这些值将映射到希尔伯特曲线上的 (x,y)。
-    D = np.arange(total, dtype=np.uint32)
-    
-    # 初始化 x, y 均为 0，稍后会逐步在每个位平面上进行旋转和偏移。
-    X = np.zeros_like(D)
-    Y = np.zeros_like(D)
-
-    # 逐层（相当于 n 次迭代）解码，sPow 代表当前处理第几位平面
-    for sPow in range(n):
-        s = 1 << sPow           # 当前层对应的步长
-        # 取出本层要处理的两位 (rx, ry)
-        rx = (D >> 1) & 1
-        ry = (D ^ rx) & 1
-
-        # 对应标准 Hilbert 算法中的旋转/翻转操作：
-        # 当 ry=0 时可能需要翻转并交换 X、Y
-        mask_ry_zero = (ry == 0)
-        # 当 (rx=1 且 ry=0) 时需要先翻转 (X, Y) -> (s-1-X, s-1-Y)
-        mask_flip = (rx == 1) & mask_ry_zero
-
-        # 在需要翻转的像素上执行翻转
-        X[mask_flip] = s - 1 - X[mask_flip]
-        Y[mask_flip] = s - 1 - Y[mask_flip]
-
-        # 在 ry=0 的像素上执行 (X, Y) 交换
-        idx_swap = np.where(mask_ry_zero)[0]
-        X[idx_swap], Y[idx_swap] = Y[idx_swap], X[idx_swap].copy()
-
-        # 最后按 (rx, ry) 进行坐标平移
-        X += s * rx
-        Y += s * ry
-
-        # 当前层处理完后，我们要“丢弃”这两位信息，将 D 右移2位以处理下一位平面
-        D >>= 2
-
-    # 最终将 X, Y 堆叠为 shape=(total,2) 的二维数组返回
-    return np.column_stack((X, Y))
+    if n == 0:
+        out[0, 0] = 0
+        out[0, 1] = 0
+        return 1
+
+    # 显式栈，第 level 层保存父方块的坐标高位、朝向以及下一个待访问的子方块 q
+    xs = np.zeros(n, np.int64)
+    ys = np.zeros(n, np.int64)
+    states = np.zeros(n, np.int64)
+    qs = np.zeros(n, np.int64)
+    count = 0
+    level = 0
+    while level >= 0:
+        q = qs[level]
+        if q == 4:
+            level -= 1
+            continue
+        qs[level] = q + 1
+
+        v = HILBERT_LUT[states[level] | q]
+        x = (xs[level] << 1) | ((v >> 1) & 1)
+        y = (ys[level] << 1) | (v & 1)
+        layer = n - 1 - level
+        # 子方块边长 2^layer，左上角在图像外则整块剪枝
+        if (x << layer) >= width or (y << layer) >= height:
+            continue
+        if layer == 0:
+            out[count, 0] = x
+            out[count, 1] = y
+            count += 1
+        else:
+            level += 1
+            xs[level] = x
+            ys[level] = y
+            states[level] = v & 12
+            qs[level] = 0
+    return count
 
 def generate_mapping(width, height):
     """
     生成与给定图像宽高匹配的希尔伯特曲线映射表，
     并返回包含 (x, y) 坐标对的二维 NumPy 数组，长度为 width*height。
+    映射表只用于构建下标表，不单独缓存 (剪枝生成很快)，避免与下标表重复占用内存。
     """
     max_dim = max(width, height)
-    n = math.ceil(math.log2(max_dim)) if max_dim > 0 else 1
+    n = (max_dim - 1).bit_length()  # 即 ceil(log2(max_dim))，纯整数运算无浮点误差
 
     # 记录生成希尔伯特曲线的时间
     start_time = time.time()
-    # hilbert_curve_generator(n) 返回的结果是 shape=(2^(2n), 2) 的 NumPy 数组
-    curve = hilbert_curve_generator(n)
+    # 生成时即剪掉图像外的子方块，只分配 width*height 个点，不再生成 4^n 曲线和掩码
+    # 坐标 < 2^n，n <= 16 时用 uint16 存储，更大的图像用 uint32 防止溢出
+    coord_dtype = np.uint16 if n <= 16 else np.uint32
+    valid_curve = np.empty((width * height, 2), dtype=coord_dtype)
+    hilbert_fill(n, width, height, valid_curve)
     end_time = time.time()
     print(f"生成希尔伯特曲线耗时: {end_time - start_time:.2f}秒")
 
-    # 利用 NumPy 布尔索引加速，选取 (x < width, y < height) 的坐标
-    start_time = time.time()
-    mask = (curve[:, 0] < width) & (curve[:, 1] < height)
-    # 生成符合条件的坐标
-    filtered = curve[mask]
-    # 截取前 width*height 个坐标点 (若 filtered 不足，会返回实际可用的坐标)
-    valid_curve = filtered[: (width * height)]
-    end_time = time.time()
-    print(f"生成映射表耗时: {end_time - start_time:.2f}秒")
-
-    # 返回 NumPy 数组，或者如需要 Python 列表，可再执行 valid_curve.tolist()
     return valid_curve
 
+# ---------- 像素重排内核 ----------
+@njit(parallel=True, nogil=True, cache=True)
+def permute_u32(src, dst, src_idx):
+    """
+    Numba 并行内核：dst[i] = src[src_idx[i]]。
+    src/dst 为一维 uint32 (16 位图像为 uint64) 像素视图，src_idx 为按目标顺序排好的 int32 一维下标，
+    循环体只有一次像素读和一次顺序像素写，运行时释放 GIL。
+    """
+    for i in prange(src_idx.shape[0]):
+        dst[i] = src[src_idx[i]]
+
+@lru_cache(maxsize=4)
+def permutation_indices(width, height, offset):
+    """
+    生成沿希尔伯特曲线平移 offset 位的 gather 下标表 src_idx：new[k] = old[src_idx[k]]。
+    先得到曲线顺序下的 (源, 目标) 下标对，再按目标下标重排 (置换求逆只需一次 O(N) 散写，
+    无需 argsort)，这样写入按行连续，每条缓存行只写一次，随机访问只剩读取。
+    按 (width, height, offset) 缓存，返回只读 int32 数组 (要求 width*height < 2^31)。
+    每个下标表占 4*width*height 字节，且每个进程各有一份，只保留最近几个。
+    """
+    curve = generate_mapping(width, height)
+    flat = curve[:, 1].astype(np.int32) * width + curve[:, 0]
+    # 第 i 个曲线像素 flat[i] 搬到第 (i+offset)%total 个曲线像素
+    src_idx = np.empty_like(flat)
+    src_idx[np.roll(flat, -offset)] = flat
+    src_idx.setflags(write=False)
+    return src_idx
+
+def permute_pixels(pix32, offset):
+    """
+    沿希尔伯特曲线将 uint32 (16 位图像为 uint64) 像素循环平移 offset 位 (0 <= offset < total)，返回新数组。
+    所有尺寸 (包括 2^n 正方形) 都使用缓存的一维下标表，按目标顺序 gather。
+    """
+    height, width = pix32.shape
+    # 映射覆盖所有像素，内核会写满 new32，无需清零
+    new32 = np.empty_like(pix32)
+    src_idx = permutation_indices(width, height, offset)
+    permute_u32(pix32.reshape(-1), new32.reshape(-1), src_idx)
+    return new32
+
+def _process_image(input_path, output_path, decrypt):
+    """
+    读取图像 -> 沿希尔伯特曲线循环平移 -> 保存。
+    解密是加密的逆置换，只需把平移量取反，加解密共用同一个内核。
+    """
+    img = cv2.imread(input_path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise FileNotFoundError("输入文件不存在或无法读取")
+
+    # 转换为RGBA格式
+    if img.shape[2] == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGBA)
+    else:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
+
+    height, width = img.shape[:2]
+    total = width * height
+
+    # 内存视图优化
+    pixels = np.ascontiguousarray(img)
+    # RGBA 四个通道合并为一个整数：8 位图像为 uint32，16 位 PNG 为 uint64
+    pixel_dtype = np.uint32 if pixels.itemsize == 1 else np.uint64
+    pix32 = pixels.view(pixel_dtype).reshape(height, width)
+
+    # 单次并行遍历完成映射，解密时反向平移
+    offset = int(GOLDEN_RATIO * total)
+    shift = -offset if decrypt else offset
+    new32 = permute_pixels(pix32, shift % total)
+    new_pixels = new32.view(pixels.dtype).reshape(height, width, 4)
+
+    # 根据后缀判断是否要转换为BGR并设置JPEG质量
+    if output_path.lower().endswith(('.jpg', '.jpeg')):
+        cv2.imwrite(
+            output_path,
+            cv2.cvtColor(new_pixels, cv2.COLOR_RGBA2BGR),
+            [cv2.IMWRITE_JPEG_QUALITY, 95]
+        )
+    else:
+        cv2.imwrite(output_path, new_pixels)
+
 def encrypt_image(input_path, output_path):
     """使用OpenCV和内存视图加速 - 希尔伯特混淆加密"""
     try:
-        img = cv2.imread(input_path, cv2.IMREAD_UNCHANGED)
-        if img is None:
-            raise FileNotFoundError("输入文件不存在或无法读取")
-
-        # 转换为RGBA格式
-        if img.shape[2] == 3:
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGBA)
-        else:
-            img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
-            
-        height, width = img.shape[:2]
-        total = width * height
-        
-        # 生成映射表
-        curve = generate_mapping(width, height)
-        curve_array = np.array(curve, dtype=np.uint32).reshape(-1, 2)
-        
-        # 内存视图优化
-        pixels = np.ascontiguousarray(img)
-        new_pixels = np.zeros_like(pixels)
-        
-        # 向量化操作
-        offset = int(GOLDEN_RATIO * total)
-        new_inds = (np.arange(total) + offset) % total
-        
-        # 使用高级索引一次性完成映射
-        new_pixels[curve_array[new_inds, 1], curve_array[new_inds, 0]] = \
-            pixels[curve_array[:, 1], curve_array[:, 0]]
-        
-        # OpenCV保存
-        if output_path.lower().endswith(('.jpg', '.jpeg')):
-            cv2.imwrite(
-                output_path,
-                cv2.cvtColor(new_pixels, cv2.COLOR_RGBA2BGR),
-                [cv2.IMWRITE_JPEG_QUALITY, 95]
-            )
-        else:
-            cv2.imwrite(output_path, new_pixels)
-
+        _process_image(input_path, output_path, decrypt=False)
     except Exception as e:
         print(f"加密出现错误: {input_path} - {str(e)}")
 
 def decrypt_image(input_path, output_path):
-    """使用OpenCV和内存视图+高级索引完成希尔伯特解密"""
+    """使用OpenCV和内存视图加速 - 希尔伯特解密"""
     try:
-        img = cv2.imread(input_path, cv2.IMREAD_UNCHANGED)
-        if img is None:
-            raise FileNotFoundError("图像文件未找到或无法读取")
-
-        # 转为RGBA通道以统一处理
-        if img.shape[2] == 3:
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGBA)
-        else:
-            img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
-
-        height, width = img.shape[:2]
-        total = width * height
-
-        # 生成曲线映射表
-        curve = generate_mapping(width, height)
-        curve_array = np.array(curve, dtype=np.uint32).reshape(-1, 2)
-
-        # 原图像像素
-        pixels = np.ascontiguousarray(img)
-        new_pixels = np.zeros_like(pixels)
-
-        # 计算偏移
-        offset = int(GOLDEN_RATIO * total)
-        # old_inds: 解密后每个像素应放的索引
-        old_inds = np.arange(total)
-        # encrypted_inds: 实际在加密图中对应的索引
-        encrypted_inds = (old_inds + offset) % total
-
-        # 利用高级索引完成解密
-        new_pixels[curve_array[old_inds, 1], curve_array[old_inds, 0]] = \
-            pixels[curve_array[encrypted_inds, 1], curve_array[encrypted_inds, 0]]
-
-        # 根据后缀判断是否要转换为BGR并设置JPEG质量
-        if output_path.lower().endswith(('.jpg', '.jpeg')):
-            out_bgr = cv2.cvtColor(new_pixels, cv2.COLOR_RGBA2BGR)
-            cv2.imwrite(output_path, out_bgr, [cv2.IMWRITE_JPEG_QUALITY, 95])
-        else:
-            cv2.imwrite(output_path, new_pixels)
-
+        _process_image(input_path, output_path, decrypt=True)
     except Exception as e:
         print(f"解密时出现错误: {input_path} - {str(e)}")
 
+def _init_worker():
+    """进程池初始化：文件级并行已占满 CPU，进程内的 Numba 并行内核改为单线程"""
+    set_num_threads(1)
+
 def main():
     """
-    主函数，用于解析命令行参数，执行加密/解密操作(单线程循环处理)
+    主函数，用于解析命令行参数，执行加密/解密操作(多进程并行处理)
     """
     print("程序启动... (注意：本程序将直接覆盖原文件)")
-    parser = argparse.ArgumentParser(description="希尔伯特混淆/解混淆 CLI (覆盖原图, 单线程)")
+    parser = argparse.ArgumentParser(description="希尔伯特混淆/解混淆 CLI (覆盖原图, 多进程)")
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("-e", "--encrypt", action="store_true", help="加密文件夹内图像")
     group.add_argument("-d", "--decrypt", action="store_true", help="解密文件夹内图像")
@@ -199,18 +209,22 @@ def main():
 
     print(f"即将处理 {len(files)} 个文件...")
 
-    for i, f in enumerate(files, start=1):
-        print(f"[{i}/{len(files)}] 正在处理 -> {f}")
-        path = os.path.join(target_folder, f)
-        if args.encrypt:
-            encrypt_image(path, path)
-            print(f"[{i}/{len(files)}] 已完成加密: {f}")
-        else:
-            decrypt_image(path, path)
-            print(f"[{i}/{len(files)}] 已完成解密: {f}")
+    task, action = (encrypt_image, "加密") if args.encrypt else (decrypt_image, "解密")
+
+    # 每个文件独立处理，使用进程池并行；各进程内映射表缓存对同尺寸图像复用
+    # 默认进程数已按 CPU 数封顶 (Windows 上不超过 61)，每个进程内 Numba 只用单线程，避免线程超额订阅
+    with ProcessPoolExecutor(initializer=_init_worker) as executor:
+        futures = {}
+        for f in files:
+            path = os.path.join(target_folder, f)
+            futures[executor.submit(task, path, path)] = f
+        for i, future in enumerate(as_completed(futures), start=1):
+            future.result()
+            print(f"[{i}/{len(files)}] 已完成{action}: {futures[future]}")
 
     end_time = time.time()
     print(f"全部处理完成，总耗时: {end_time - start_time:.2f}秒")
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # 打包为 exe 后进程池需要
     main()
\ No newline at end of file
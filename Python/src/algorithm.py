@@ -1,7 +1,12 @@
 # algorithm.py
+import os
 import math
 import numpy as np
-from PIL import Image
+from functools import lru_cache
+import cv2
+
+# 希尔伯特解码状态表，下标为 (朝向 << 2) | 当前两位，值为 (下一朝向 << 2) | (dx << 1) | dy
+_HILBERT_LUT = np.array([4, 1, 3, 10, 0, 6, 7, 13, 15, 9, 8, 2, 11, 14, 12, 5], dtype=np.uint8)
 
 class HilbertImageProcessor:
     """
@@ -26,8 +31,7 @@ class HilbertImageProcessor:
         :param mode: 操作模式 'encrypt' 或 'decrypt'
         """
         # 加载图像
-        img = Image.open(input_path).convert("RGBA")
-        pixels = np.array(img)
+        pixels = self._load_image(input_path)
 
         # 执行核心处理
         processed_pixels = self._process_pixels(pixels, mode)
@@ -35,65 +39,91 @@ class HilbertImageProcessor:
         # 保存结果
         self._save_image(processed_pixels, output_path)
 
-    def _generate_hilbert_curve(self, width: int, height: int) -> np.ndarray:
-        """生成适配图像尺寸的希尔伯特映射表"""
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _generate_hilbert_curve(width: int, height: int) -> np.ndarray:
+        """生成适配图像尺寸的希尔伯特映射表（按尺寸缓存，返回只读数组）"""
         max_dim = max(width, height)
-        n = math.ceil(math.log2(max_dim)) if max_dim > 0 else 1
-        size = 1 << n
+        n = (max_dim - 1).bit_length()  # 即 ceil(log2(max_dim))，纯整数运算无浮点误差
         
-        # 生成基础曲线
-        D = np.arange(size*size, dtype=np.uint32)
-        X, Y = np.zeros_like(D), np.zeros_like(D)
-
-        for sPow in range(n):
-            s = 1 << sPow
-            rx = (D >> 1) & 1
-            ry = (D ^ rx) & 1
+        # 查表法自高位向低位逐层展开四叉树，整块落在图像外的子方块直接剪枝，
+        # 工作量为 O(width*height)，无需生成完整的 4^n 曲线再筛选
+        # 坐标 < 2^n，n <= 16 时使用 uint16 减少内存占用，否则使用 uint32 防止溢出
+        coord_dtype = np.uint16 if n <= 16 else np.uint32
+        X = np.zeros(1, dtype=coord_dtype)
+        Y = np.zeros(1, dtype=coord_dtype)
+        state = np.zeros(1, dtype=np.uint8)
+        q = np.arange(4, dtype=np.uint8)
+
+        for layer in range(n - 1, -1, -1):
+            v = _HILBERT_LUT[(state[:, None] | q).ravel()]
 
             # 坐标变换
-            mask_flip = (rx == 1) & (ry == 0)
-            X[mask_flip] = s - 1 - X[mask_flip]
-            Y[mask_flip] = s - 1 - Y[mask_flip]
+            X = (np.repeat(X, 4) << 1) | ((v >> 1) & 1)
+            Y = (np.repeat(Y, 4) << 1) | (v & 1)
+            state = v & 12
 
-            idx_swap = np.where(ry == 0)[0]
-            X[idx_swap], Y[idx_swap] = Y[idx_swap], X[idx_swap].copy()
+            # 剪掉左上角已超出图像的子方块 (边长 2^layer)
+            limit_x = (width + (1 << layer) - 1) >> layer
+            limit_y = (height + (1 << layer) - 1) >> layer
+            if limit_x < (1 << (n - layer)) or limit_y < (1 << (n - layer)):
+                keep = (X < limit_x) & (Y < limit_y)
+                X, Y, state = X[keep], Y[keep], state[keep]
 
-            X += s * rx
-            Y += s * ry
-            D >>= 2
-
-        # 筛选有效坐标
-        curve = np.column_stack((X, Y))
-        mask = (curve[:, 0] < width) & (curve[:, 1] < height)
-        return curve[mask][:width*height]
+        valid_curve = np.column_stack((X, Y))
+        valid_curve.setflags(write=False)
+        return valid_curve
 
     def _process_pixels(self, pixels: np.ndarray, mode: str) -> np.ndarray:
         """核心像素处理逻辑"""
         height, width = pixels.shape[:2]
-        curve = self._generate_hilbert_curve(width, height)
-        total = width * height
-        offset = round(self.golden_ratio * total)
+        offset = round(self.golden_ratio * width * height)
 
-        # 生成索引
-        old_inds = np.arange(total)
-        new_inds = (old_inds + offset) % total
+        # 加密/解密即在希尔伯特顺序上正向/反向循环平移，解密是加密的逆置换
+        shift = offset if mode == "encrypt" else -offset
+        return self._permute(pixels, shift)
 
-        # 坐标映射
-        if mode == "encrypt":
-            src_coords = curve[old_inds]
-            dst_coords = curve[new_inds]
-        else:
-            src_coords = curve[new_inds]
-            dst_coords = curve[old_inds]
+    def _permute(self, pixels: np.ndarray, shift: int) -> np.ndarray:
+        """沿希尔伯特曲线将像素循环平移 shift 位"""
+        height, width = pixels.shape[:2]
+        curve = self._generate_hilbert_curve(width, height)
 
-        # 执行像素重排
-        new_pixels = np.zeros_like(pixels)
-        new_pixels[dst_coords[:, 1], dst_coords[:, 0]] = pixels[src_coords[:, 1], src_coords[:, 0]]
-        return new_pixels
+        # 曲线坐标转换为一维下标，每个 RGBA 像素视为一个 uint32 做一维索引
+        flat = curve[:, 1].astype(np.int64) * width + curve[:, 0]
+        old_flat = np.ascontiguousarray(pixels).view(np.uint32).reshape(-1)
+
+        # 按曲线顺序 gather，平移后按曲线顺序 scatter（映射覆盖全部像素，无需清零）
+        new_flat = np.empty_like(old_flat)
+        new_flat[flat] = np.roll(old_flat[flat], shift)
+        return new_flat.view(np.uint8).reshape(height, width, 4)
+
+    def _load_image(self, input_path: str) -> np.ndarray:
+        """读取图像并统一为 RGBA"""
+        # cv2.imread 在 Windows 上无法打开非 ASCII 路径，先按字节读入再解码
+        try:
+            data = np.fromfile(input_path, dtype=np.uint8)
+        except OSError:
+            data = np.empty(0, dtype=np.uint8)
+        img = cv2.imdecode(data, cv2.IMREAD_UNCHANGED) if data.size else None
+        if img is None:
+            raise FileNotFoundError(f"输入文件不存在或无法读取: {input_path}")
+        if img.dtype == np.uint16:
+            img = (img >> 8).astype(np.uint8)
+        if img.ndim == 2:
+            return cv2.cvtColor(img, cv2.COLOR_GRAY2RGBA)
+        if img.shape[2] == 3:
+            return cv2.cvtColor(img, cv2.COLOR_BGR2RGBA)
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
 
     def _save_image(self, pixels: np.ndarray, output_path: str) -> None:
         """智能保存图像"""
-        img = Image.fromarray(pixels)
-        if output_path.lower().endswith(('.jpg', '.jpeg')) and img.mode == 'RGBA':
-            img = img.convert('RGB')
-        img.save(output_path)
\ No newline at end of file
+        ext = os.path.splitext(output_path)[1].lower()
+        if ext in ('.jpg', '.jpeg'):
+            ok, buf = cv2.imencode(ext, cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGR),
+                                   [cv2.IMWRITE_JPEG_QUALITY, 95])
+        else:
+            ok, buf = cv2.imencode(ext, cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGRA))
+        if not ok:
+            raise OSError(f"无法编码输出图像: {output_path}")
+        # 按字节写出以支持非 ASCII 路径，写入失败时 tofile 直接抛出 OSError
+        buf.tofile(output_path)
\ No newline at end of file